@@ -1,21 +1,35 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func, text
-from typing import List, Optional
-from app.models import Product, Webhook, ImportJob
+from sqlalchemy import or_, func, text, select, insert, tuple_
+from typing import Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta, timezone
+import json
+from app.models import Product, ProductTombstone, Webhook, ImportJob, ImportReject
 from app.schemas import ProductCreate, ProductUpdate, WebhookCreate
+from app.config import settings
 
 # Product CRUD
-def get_products(
-    db: Session, 
-    skip: int = 0, 
-    limit: int = 100,
+PRODUCT_LIST_FIELDS = ("id", "sku", "name", "description", "active", "created_at", "updated_at")
+
+def parse_product_fields(fields: Optional[str]) -> Sequence[str]:
+    """Turn a `fields=` value into a de-duplicated column list (ValueError if invalid)"""
+    if fields is None:
+        return PRODUCT_LIST_FIELDS
+    allowed = ", ".join(PRODUCT_LIST_FIELDS)
+    selected = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    if not selected:
+        raise ValueError(f"No fields selected. Allowed: {allowed}")
+    invalid = [f for f in selected if f not in PRODUCT_LIST_FIELDS]
+    if invalid:
+        raise ValueError(f"Invalid fields: {', '.join(invalid)}. Allowed: {allowed}")
+    return selected
+
+def _filter_products(
+    query,
     sku: Optional[str] = None,
     name: Optional[str] = None,
     active: Optional[bool] = None,
     description: Optional[str] = None
-) -> List[Product]:
-    query = db.query(Product)
-    
+):
     if sku:
         query = query.filter(Product.sku.ilike(f"%{sku}%"))
     if name:
@@ -24,9 +38,42 @@ def get_products(
         query = query.filter(Product.active == active)
     if description:
         query = query.filter(Product.description.ilike(f"%{description}%"))
-    
+    return query
+
+def get_products(
+    db: Session, 
+    skip: int = 0, 
+    limit: int = 100,
+    sku: Optional[str] = None,
+    name: Optional[str] = None,
+    active: Optional[bool] = None,
+    description: Optional[str] = None
+) -> List[Product]:
+    query = _filter_products(
+        db.query(Product),
+        sku=sku, name=name, active=active, description=description
+    )
     return query.offset(skip).limit(limit).all()
 
+def get_product_rows(
+    db: Session,
+    fields: Sequence[str] = PRODUCT_LIST_FIELDS,
+    skip: int = 0,
+    limit: int = 100,
+    sku: Optional[str] = None,
+    name: Optional[str] = None,
+    active: Optional[bool] = None,
+    description: Optional[str] = None
+) -> List[dict]:
+    """Select only the requested columns as plain dicts (no ORM objects)"""
+    columns = [Product.__table__.c[field] for field in fields]
+    stmt = _filter_products(
+        select(*columns),
+        sku=sku, name=name, active=active, description=description
+    )
+    result = db.execute(stmt.offset(skip).limit(limit))
+    return [dict(row) for row in result.mappings()]
+
 def get_product(db: Session, product_id: int) -> Optional[Product]:
     return db.query(Product).filter(Product.id == product_id).first()
 
@@ -53,6 +100,7 @@ def delete_product(db: Session, product_id: int) -> bool:
     try:
         db_product = db.query(Product).filter(Product.id == product_id).first()
         if db_product:
+            db.add(ProductTombstone(product_id=db_product.id, sku=db_product.sku))
             db.delete(db_product)
             db.commit()
             return True
@@ -76,6 +124,7 @@ def delete_all_products_sync(db: Session) -> int:
             return 0
             
         # This is the most reliable way
+        tombstone_all_products(db)
         deleted_count = db.query(Product).delete()
         db.commit()
         
@@ -89,6 +138,57 @@ def delete_all_products_sync(db: Session) -> int:
         db.rollback()
         raise e
 
+def tombstone_all_products(db: Session) -> None:
+    """Record a delete tombstone for every product (call before a bulk delete)"""
+    db.execute(
+        insert(ProductTombstone).from_select(
+            ["product_id", "sku"], select(Product.id, Product.sku)
+        )
+    )
+
+def get_change_watermark(db: Session) -> int:
+    """Oldest transaction id still running; every older writer has finished"""
+    return db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+
+def get_product_changes(
+    db: Session, since: Tuple[int, int] = (0, 0), limit: int = 500
+) -> List[dict]:
+    """Upserts and delete tombstones after the (txid, seq) position `since`.
+    
+    Changes are ordered by (change_txid, change_seq) and capped below the
+    watermark, so rows from transactions still in flight are held back
+    instead of being skipped once they commit.
+    """
+    watermark = get_change_watermark(db)
+    upserts = db.execute(
+        select(
+            Product.change_txid.label("txid"),
+            Product.change_seq.label("seq"),
+            *[Product.__table__.c[field] for field in PRODUCT_LIST_FIELDS]
+        ).where(
+            tuple_(Product.change_txid, Product.change_seq) > tuple_(*since),
+            Product.change_txid < watermark
+        ).order_by(Product.change_txid, Product.change_seq).limit(limit)
+    ).mappings()
+    deletes = db.execute(
+        select(
+            ProductTombstone.change_txid.label("txid"),
+            ProductTombstone.change_seq.label("seq"),
+            ProductTombstone.product_id.label("id"),
+            ProductTombstone.sku,
+            ProductTombstone.deleted_at
+        ).where(
+            tuple_(ProductTombstone.change_txid, ProductTombstone.change_seq) > tuple_(*since),
+            ProductTombstone.change_txid < watermark
+        ).order_by(ProductTombstone.change_txid, ProductTombstone.change_seq).limit(limit)
+    ).mappings()
+    
+    # Each side is already ordered and limited, so merging the two pages is exact
+    changes = [{"op": "upsert", **row} for row in upserts]
+    changes += [{"op": "delete", **row} for row in deletes]
+    changes.sort(key=lambda change: (change["txid"], change["seq"]))
+    return changes[:limit]
+
 # Webhook CRUD
 def get_webhooks(db: Session) -> List[Webhook]:
     return db.query(Webhook).all()
@@ -109,12 +209,82 @@ def delete_webhook(db: Session, webhook_id: int) -> bool:
     return False
 
 # Import Job CRUD
-def create_import_job(db: Session, job_id: str, filename: str) -> ImportJob:
-    db_job = ImportJob(job_id=job_id, filename=filename)
+def create_import_job(
+    db: Session, job_id: str, filename: str, content_hash: Optional[str] = None
+) -> ImportJob:
+    db_job = ImportJob(job_id=job_id, filename=filename, content_hash=content_hash)
     db.add(db_job)
     db.commit()
     db.refresh(db_job)
     return db_job
 
 def get_import_job(db: Session, job_id: str) -> Optional[ImportJob]:
-    return db.query(ImportJob).filter(ImportJob.job_id == job_id).first()
\ No newline at end of file
+    return db.query(ImportJob).filter(ImportJob.job_id == job_id).first()
+
+def add_import_rejects(db: Session, job_id: str, rejects: Iterable[tuple]) -> None:
+    """Stage (line_number, record, reason) rejects; committed with the caller's batch"""
+    db.add_all([
+        ImportReject(
+            job_id=job_id,
+            line_number=line_number,
+            reason=reason,
+            row_data=json.dumps({k: v for k, v in record.items() if k is not None})
+        )
+        for line_number, record, reason in rejects
+    ])
+
+def get_import_rejects(db: Session, job_id: str):
+    return db.query(ImportReject).filter(
+        ImportReject.job_id == job_id
+    ).order_by(ImportReject.id).yield_per(1000)
+
+def has_import_rejects(db: Session, job_id: str) -> bool:
+    return db.query(ImportReject.id).filter(ImportReject.job_id == job_id).first() is not None
+
+def delete_expired_import_rejects(db: Session) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.REJECTS_RETENTION_DAYS)
+    deleted_count = db.query(ImportReject).filter(
+        ImportReject.created_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted_count
+
+def get_catalog_version(db: Session) -> int:
+    """Catalog high-water mark: moves on every product write, delete or bulk delete"""
+    return db.execute(text(
+        "SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM product_change_seq"
+    )).scalar()
+
+def get_current_txid(db: Session) -> int:
+    return db.execute(text("SELECT pg_current_xact_id()::text::bigint")).scalar()
+
+def catalog_changed_by_others(db: Session, start: int, end: int, own_txids: Iterable[int]) -> bool:
+    """Whether anything but the given transactions wrote the catalog in (start, end]"""
+    # Writers still in flight may hold sequence values in the range without
+    # their rows being visible yet, so the range cannot be vouched for
+    in_flight = db.execute(text(
+        "SELECT pg_snapshot_xmin(s) < pg_snapshot_xmax(s) FROM pg_current_snapshot() AS s"
+    )).scalar()
+    if in_flight:
+        return True
+    
+    foreign_write = db.query(Product.id).filter(
+        Product.change_seq > start,
+        Product.change_seq <= end,
+        Product.change_txid.notin_(list(own_txids))
+    ).first()
+    foreign_delete = db.query(ProductTombstone.id).filter(
+        ProductTombstone.change_seq > start,
+        ProductTombstone.change_seq <= end
+    ).first()
+    return foreign_write is not None or foreign_delete is not None
+
+def find_duplicate_import(db: Session, content_hash: str) -> Optional[ImportJob]:
+    """Latest finished import of an identical file, if the catalog is unchanged since"""
+    previous = db.query(ImportJob).filter(
+        ImportJob.content_hash == content_hash,
+        ImportJob.status.in_(["completed", "completed_with_errors"])
+    ).order_by(ImportJob.updated_at.desc()).first()
+    if previous is None or previous.catalog_version is None:
+        return None
+    return previous if previous.catalog_version == get_catalog_version(db) else None
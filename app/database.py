@@ -1,11 +1,119 @@
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read replicas - only used by read-only endpoints via get_read_db
+replica_engines = [
+    create_engine(
+        url,
+        pool_pre_ping=True,
+        connect_args={"connect_timeout": settings.REPLICA_CONNECT_TIMEOUT}
+    )
+    for url in settings.DATABASE_REPLICA_URLS
+]
+ReplicaSessions = [
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    for replica_engine in replica_engines
+]
+
+# Replica health is refreshed by a background thread; requests only read it.
+# Replicas count as unhealthy until their first successful probe.
+_replica_health = [False] * len(replica_engines)
+_replica_cursor = 0
+_health_thread = None
+_health_lock = threading.Lock()
+
+# Cookie set by write requests so the same client reads from the primary
+PRIMARY_STICKY_COOKIE = "read_primary"
+
+# Replay lag in seconds: 0 when the replica has replayed the primary's current
+# WAL position (or is not a standby), otherwise time since the last replayed
+# commit. A replica whose WAL receiver is disconnected stops replaying, so its
+# lag grows as soon as the primary takes new writes. NULL means never replayed.
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn) THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+def _set_probe_timeout(conn) -> None:
+    timeout_ms = int(settings.REPLICA_CONNECT_TIMEOUT * 1000)
+    conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+
+def get_primary_wal_lsn():
+    """Current WAL position of the primary, or None if it cannot be read"""
+    try:
+        with engine.connect() as conn:
+            _set_probe_timeout(conn)
+            return conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+    except Exception as e:
+        logger.warning(f"Could not read primary WAL position: {e}")
+        return None
+
+def check_replica(index: int, primary_lsn) -> bool:
+    """Probe a replica: reachable and lagging less than REPLICA_MAX_LAG_SECONDS"""
+    if primary_lsn is None:
+        return False
+    try:
+        with replica_engines[index].connect() as conn:
+            _set_probe_timeout(conn)
+            lag = conn.execute(REPLICA_LAG_QUERY, {"primary_lsn": primary_lsn}).scalar()
+        healthy = lag is not None and float(lag) <= settings.REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning(f"Replica {index} lagging ({lag}s), using primary")
+    except Exception as e:
+        logger.warning(f"Replica {index} health check failed: {e}")
+        healthy = False
+    return healthy
+
+def refresh_replica_health() -> None:
+    primary_lsn = get_primary_wal_lsn()
+    for index in range(len(replica_engines)):
+        _replica_health[index] = check_replica(index, primary_lsn)
+
+def _replica_health_loop():
+    while True:
+        try:
+            refresh_replica_health()
+        except Exception as e:
+            logger.error(f"Replica health refresh failed: {e}")
+        time.sleep(settings.REPLICA_HEALTH_CHECK_INTERVAL)
+
+def start_replica_health_checks() -> None:
+    """Start the background health refresher once per process"""
+    global _health_thread
+    with _health_lock:
+        if _health_thread is None and replica_engines:
+            _health_thread = threading.Thread(
+                target=_replica_health_loop, name="replica-health", daemon=True
+            )
+            _health_thread.start()
+
+def get_read_session(use_primary: bool = False):
+    """Session on a healthy replica (round-robin), or the primary if none is"""
+    global _replica_cursor
+    if ReplicaSessions and not use_primary:
+        start_replica_health_checks()
+        start = _replica_cursor
+        _replica_cursor = (start + 1) % len(ReplicaSessions)
+        for offset in range(len(ReplicaSessions)):
+            index = (start + offset) % len(ReplicaSessions)
+            if _replica_health[index]:
+                return ReplicaSessions[index]()
+    return SessionLocal()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -13,11 +121,75 @@ def get_db():
     finally:
         db.close()
 
-def create_tables():
+def get_read_db(request: Request):
+    # Clients that just wrote read from the primary to see their own writes
+    db = get_read_session(use_primary=PRIMARY_STICKY_COOKIE in request.cookies)
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Idempotent upgrades for databases created before these columns were added
+# (create_all only creates missing tables). Each step runs only when needed,
+# so a normal startup takes no table locks. Existing products and tombstones
+# are backfilled with a change position so the first since=0 sync of the
+# change feed returns the whole catalog.
+CURRENT_TXID_SQL = "pg_current_xact_id()::text::bigint"
+
+COLUMN_UPGRADES = [
+    ("products", "change_seq", "BIGINT DEFAULT nextval('product_change_seq')"),
+    ("products", "change_txid", f"BIGINT DEFAULT ({CURRENT_TXID_SQL})"),
+    ("product_tombstones", "change_txid", f"BIGINT DEFAULT ({CURRENT_TXID_SQL})"),
+    ("import_jobs", "rejected_records", "INTEGER DEFAULT 0"),
+    ("import_jobs", "content_hash", "VARCHAR(64)"),
+    ("import_jobs", "catalog_version", "BIGINT"),
+]
+
+CHANGE_TRACKED_TABLES = ["products", "product_tombstones"]
+
+INDEX_UPGRADES = [
+    ("products", "ix_products_change_seq", "(change_seq)"),
+    ("products", "ix_products_change", "(change_txid, change_seq)"),
+    ("product_tombstones", "ix_product_tombstones_change_seq", "(change_seq)"),
+    ("product_tombstones", "ix_product_tombstones_change", "(change_txid, change_seq)"),
+    ("import_jobs", "ix_import_jobs_content_hash", "(content_hash)"),
+]
+
+def upgrade_schema(bind=None):
+    # The web service and the Celery worker both run this at startup
+    with (bind or engine).begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('product_importer_schema'))"))
+        
+        inspector = inspect(conn)
+        for table, column, ddl in COLUMN_UPGRADES:
+            if column not in {c["name"] for c in inspector.get_columns(table)}:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        
+        inspector = inspect(conn)
+        for table in CHANGE_TRACKED_TABLES:
+            columns = {c["name"]: c for c in inspector.get_columns(table)}
+            if columns["change_seq"]["nullable"] or columns["change_txid"]["nullable"]:
+                conn.execute(text(f"""
+                    UPDATE {table} SET
+                        change_seq = COALESCE(change_seq, nextval('product_change_seq')),
+                        change_txid = COALESCE(change_txid, {CURRENT_TXID_SQL})
+                    WHERE change_seq IS NULL OR change_txid IS NULL
+                """))
+                conn.execute(text(
+                    f"ALTER TABLE {table} ALTER COLUMN change_seq SET NOT NULL, "
+                    f"ALTER COLUMN change_txid SET NOT NULL"
+                ))
+        
+        for table, index, columns in INDEX_UPGRADES:
+            if index not in {i["name"] for i in inspector.get_indexes(table)}:
+                conn.execute(text(f"CREATE INDEX {index} ON {table} {columns}"))
+
+def create_tables(bind=None):
     from app.models import Base
     try:
-        Base.metadata.create_all(bind=engine)
+        Base.metadata.create_all(bind=bind or engine)
+        upgrade_schema(bind)
         print("Database tables created successfully")
     except Exception as e:
         print(f"Error creating tables: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -1,16 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
+import os
+import io
+import csv
 import uuid
+import hashlib
 import json
+import orjson
 from typing import List, Optional
 
 from app import crud, models, schemas, tasks
-from app.database import get_db, create_tables
+from app.database import SessionLocal, get_db, get_read_db, create_tables, PRIMARY_STICKY_COOKIE
 from app.config import settings
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+CSV_STREAM_CHUNK_SIZE = 64 * 1024
+
 app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION)
 
 # CORS middleware
@@ -22,6 +31,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Gzip large responses (product listings) when the client accepts it
+if settings.GZIP_MINIMUM_SIZE > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+
+# Read-your-writes: after a successful write, or when a background import or
+# bulk delete finishes, pin this client's reads to the primary long enough
+# for replicas to catch up
+def pin_reads_to_primary(response: Response):
+    if settings.DATABASE_REPLICA_URLS:
+        response.set_cookie(
+            PRIMARY_STICKY_COOKIE, "1",
+            max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True, samesite="lax"
+        )
+
+@app.middleware("http")
+async def pin_reads_after_write(request: Request, call_next):
+    response = await call_next(request)
+    if (
+        request.method not in ("GET", "HEAD", "OPTIONS")
+        and request.url.path.startswith("/api/")
+        and response.status_code < 400
+    ):
+        pin_reads_to_primary(response)
+    return response
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -30,7 +64,19 @@ def startup_event():
     create_tables()
 
 # Product endpoints
-@app.get("/api/products/", response_model=List[schemas.Product])
+@app.get(
+    "/api/products/",
+    responses={
+        200: {
+            "description": "Products; with `fields=` each object holds only the requested columns",
+            "content": {
+                "application/json": {
+                    "example": [{"id": 1, "sku": "ABC123", "name": "Product One"}]
+                }
+            }
+        }
+    }
+)
 def read_products(
     skip: int = 0,
     limit: int = 100,
@@ -38,12 +84,21 @@ def read_products(
     name: Optional[str] = None,
     active: Optional[bool] = None,
     description: Optional[str] = None,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    return crud.get_products(
-        db, skip=skip, limit=limit, 
+    # Sparse fieldsets: ?fields=id,sku,name selects only those columns
+    try:
+        selected = crud.parse_product_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = crud.get_product_rows(
+        db, fields=selected, skip=skip, limit=limit,
         sku=sku, name=name, active=active, description=description
     )
+    # Serialize rows directly, skipping per-row Pydantic validation
+    return Response(content=orjson.dumps(rows), media_type="application/json")
 
 @app.post("/api/products/", response_model=schemas.Product)
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
@@ -52,8 +107,35 @@ def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)
         raise HTTPException(status_code=400, detail="SKU already exists")
     return crud.create_product(db=db, product=product)
 
+@app.get("/api/products/changes")
+def read_product_changes(since: str = "0", limit: int = 500, db: Session = Depends(get_read_db)):
+    # Tokens are "<txid>-<seq>"; "0" starts from the beginning
+    try:
+        since_position = (0, 0) if since == "0" else tuple(int(part) for part in since.split("-"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since token")
+    if len(since_position) != 2:
+        raise HTTPException(status_code=400, detail="Invalid since token")
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    
+    changes = crud.get_product_changes(db, since=since_position, limit=limit)
+    next_token = f"{changes[-1]['txid']}-{changes[-1]['seq']}" if changes else since
+    return Response(
+        content=orjson.dumps({
+            "changes": changes,
+            "next_token": next_token,
+            "has_more": len(changes) == limit
+        }),
+        media_type="application/json"
+    )
+
+@app.get("/api/products/count")
+def count_products(db: Session = Depends(get_read_db)):
+    return {"count": crud.get_products_count(db)}
+
 @app.get("/api/products/{product_id}", response_model=schemas.Product)
-def read_product(product_id: int, db: Session = Depends(get_db)):
+def read_product(product_id: int, db: Session = Depends(get_read_db)):
     db_product = crud.get_product(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -78,12 +160,35 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
 async def upload_file(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    force: bool = False,
     db: Session = Depends(get_db)
 ):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only CSV files are allowed")
     
+    # Hash the spooled upload in chunks without keeping a copy
+    hasher = hashlib.sha256()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        hasher.update(chunk)
+    content_hash = hasher.hexdigest()
+    
+    # Identical file already imported and catalog untouched since: reuse that result
+    if not force:
+        previous_job = crud.find_duplicate_import(db, content_hash)
+        if previous_job:
+            return {
+                "job_id": previous_job.job_id,
+                "task_id": None,
+                "filename": file.filename,
+                "duplicate_of": previous_job.job_id,
+                "status": previous_job.status,
+                "processed_records": previous_job.processed_records,
+                "rejected_records": previous_job.rejected_records,
+                "message": "Identical file already imported; use force=true to re-import"
+            }
+    
     # Read file content
+    await file.seek(0)
     content = await file.read()
     file_content = content.decode('utf-8')
     
@@ -91,7 +196,7 @@ async def upload_file(
     job_id = str(uuid.uuid4())
     
     # Create import job record
-    crud.create_import_job(db, job_id, file.filename)
+    crud.create_import_job(db, job_id, file.filename, content_hash=content_hash)
     
     # Start async task
     task = tasks.import_products.delay(file_content, file.filename, job_id)
@@ -103,6 +208,47 @@ async def upload_file(
         "message": "File upload started"
     }
 
+# Rejected rows report for an import job
+def iter_rejects_csv(job_id: str):
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = None
+        for reject in crud.get_import_rejects(db, job_id):
+            record = json.loads(reject.row_data)
+            if writer is None:
+                writer = csv.DictWriter(
+                    buffer,
+                    fieldnames=["reject_line", "reject_reason"] + list(record),
+                    extrasaction="ignore"
+                )
+                writer.writeheader()
+            writer.writerow({**record, "reject_line": reject.line_number, "reject_reason": reject.reason})
+            if buffer.tell() >= CSV_STREAM_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    finally:
+        db.close()
+
+@app.get("/api/imports/{job_id}/rejects")
+def download_rejects(job_id: str, db: Session = Depends(get_db)):
+    import_job = crud.get_import_job(db, job_id)
+    if import_job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if not import_job.rejected_records:
+        raise HTTPException(status_code=404, detail="No rejected rows for this import")
+    if not crud.has_import_rejects(db, job_id):
+        raise HTTPException(status_code=404, detail="Rejects report has expired")
+    
+    stem = os.path.splitext(import_job.filename or job_id)[0]
+    return StreamingResponse(
+        iter_rejects_csv(job_id),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{stem}_rejects.csv"'}
+    )
+
 # Bulk delete endpoint - FIXED VERSION
 @app.delete("/api/products/", response_model=schemas.BulkDeleteResponse)
 def bulk_delete_products(db: Session = Depends(get_db)):
@@ -131,9 +277,11 @@ def bulk_delete_products(db: Session = Depends(get_db)):
 
 # Task status endpoint
 @app.get("/api/tasks/{task_id}")
-def get_task_status(task_id: str):
+def get_task_status(task_id: str, http_response: Response):
     try:
         task = tasks.import_products.AsyncResult(task_id)
+        if task.state == 'SUCCESS':
+            pin_reads_to_primary(http_response)
         
         if task.state == 'PENDING':
             response = {
@@ -169,9 +317,11 @@ def get_task_status(task_id: str):
 # Bulk delete task status endpoint
 # Bulk delete endpoint - WITH PROPER ERROR HANDLING
 @app.get("/api/tasks/bulk-delete/{task_id}")
-def get_bulk_delete_task_status(task_id: str):
+def get_bulk_delete_task_status(task_id: str, http_response: Response):
     try:
         task = tasks.bulk_delete_products.AsyncResult(task_id)
+        if task.state == 'SUCCESS':
+            pin_reads_to_primary(http_response)
         
         if task.state == 'PENDING':
             response = {
@@ -206,7 +356,7 @@ def get_bulk_delete_task_status(task_id: str):
     
 # Webhook endpoints
 @app.get("/api/webhooks/", response_model=List[schemas.Webhook])
-def read_webhooks(db: Session = Depends(get_db)):
+def read_webhooks(db: Session = Depends(get_read_db)):
     return crud.get_webhooks(db)
 
 @app.post("/api/webhooks/", response_model=schemas.Webhook)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, Index
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, Text, DateTime, Index, Sequence, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import uuid
@@ -8,6 +8,14 @@ Base = declarative_base()
 def generate_uuid():
     return str(uuid.uuid4())
 
+# Monotonic change sequence shared by product writes and delete tombstones
+product_change_seq = Sequence("product_change_seq", metadata=Base.metadata)
+
+# Id of the writing transaction. The change feed orders by (change_txid,
+# change_seq) and only returns transactions older than the oldest one still
+# running, so a slow writer can never commit behind a consumer's token.
+CURRENT_TXID = text("(pg_current_xact_id()::text::bigint)")
+
 class Product(Base):
     __tablename__ = "products"
     
@@ -18,9 +26,32 @@ class Product(Base):
     active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    change_seq = Column(
+        BigInteger,
+        server_default=product_change_seq.next_value(),
+        onupdate=product_change_seq.next_value(),
+        nullable=False,
+        index=True
+    )
+    change_txid = Column(BigInteger, server_default=CURRENT_TXID, onupdate=CURRENT_TXID, nullable=False)
     
     __table_args__ = (
         Index('ix_sku_lower', func.lower(sku), unique=True),
+        Index('ix_products_change', change_txid, change_seq),
+    )
+
+class ProductTombstone(Base):
+    __tablename__ = "product_tombstones"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, nullable=False)
+    sku = Column(String(100), nullable=False)
+    change_seq = Column(BigInteger, server_default=product_change_seq.next_value(), nullable=False, index=True)
+    change_txid = Column(BigInteger, server_default=CURRENT_TXID, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index('ix_product_tombstones_change', change_txid, change_seq),
     )
 
 class Webhook(Base):
@@ -39,9 +70,24 @@ class ImportJob(Base):
     id = Column(Integer, primary_key=True, index=True)
     job_id = Column(String(100), unique=True, index=True)
     filename = Column(String(255))
+    content_hash = Column(String(64), index=True)  # sha256 of the uploaded file
+    # product_change_seq position when the job finished; NULL if other writers
+    # touched the catalog while it ran, so an identical re-upload re-imports
+    catalog_version = Column(BigInteger)
     total_records = Column(Integer, default=0)
     processed_records = Column(Integer, default=0)
+    rejected_records = Column(Integer, default=0)
     status = Column(String(50), default="pending")  # pending, processing, completed, failed
     errors = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class ImportReject(Base):
+    __tablename__ = "import_rejects"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(100), index=True, nullable=False)
+    line_number = Column(Integer)
+    reason = Column(Text)
+    row_data = Column(Text)  # original CSV row as a JSON object
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
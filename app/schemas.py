@@ -44,8 +44,11 @@ class ImportJobBase(BaseModel):
 class ImportJob(ImportJobBase):
     id: int
     job_id: str
+    content_hash: Optional[str] = None
+    catalog_version: Optional[int] = None
     total_records: int
     processed_records: int
+    rejected_records: Optional[int] = 0
     status: str
     errors: Optional[str]
     created_at: datetime
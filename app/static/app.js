@@ -123,6 +123,11 @@ class ProductImporter {
             }
 
             const result = await response.json();
+            if (result.duplicate_of) {
+                this.showAlert(result.message, 'success');
+                this.hideUploadProgress();
+                return;
+            }
             this.monitorUploadProgress(result.task_id, result.job_id);
             
         } catch (error) {
@@ -10,6 +10,10 @@ from app.models import Product, ImportJob
 from app.config import settings
 from app.celery_app import celery_app
 from app.database import SessionLocal
+from app.crud import (
+    tombstone_all_products, add_import_rejects, delete_expired_import_rejects,
+    get_catalog_version, get_current_txid, catalog_changed_by_others
+)
 
 # Logging setup
 logger = logging.getLogger(__name__)
@@ -17,6 +21,91 @@ logger = logging.getLogger(__name__)
 def get_db_session():
     return SessionLocal()
 
+IMPORT_BATCH_SIZE = 100
+SKU_MAX_LENGTH = Product.__table__.c.sku.type.length
+NAME_MAX_LENGTH = Product.__table__.c.name.type.length
+
+def count_csv_records(file_content: str) -> int:
+    """Number of data rows, counted without keeping them (blank lines skipped)"""
+    rows = sum(1 for row in csv.reader(io.StringIO(file_content)) if row)
+    return max(rows - 1, 0)
+
+def iter_import_batches(reader, batch_size: int = IMPORT_BATCH_SIZE):
+    """Yield lists of (line_number, record) from a DictReader"""
+    batch = []
+    for record in reader:
+        batch.append((reader.line_num, record))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def validate_import_row(record: dict) -> tuple:
+    """Return (sku, name, description) or raise ValueError for rows the DB would reject"""
+    sku = (record.get('sku') or '').strip()
+    name = (record.get('name') or '').strip()
+    description = (record.get('description') or '').strip()
+    
+    if not sku:
+        raise ValueError("Missing SKU")
+    if len(sku) > SKU_MAX_LENGTH:
+        raise ValueError(f"SKU longer than {SKU_MAX_LENGTH} characters")
+    if len(name) > NAME_MAX_LENGTH:
+        raise ValueError(f"Name longer than {NAME_MAX_LENGTH} characters")
+    return sku, name, description
+
+def apply_import_rows(db, rows: dict) -> None:
+    """Upsert rows keyed by lower-cased SKU, with one lookup for the whole batch"""
+    if not rows:
+        return
+    existing = {
+        product.sku.lower(): product
+        for product in db.query(Product).filter(func.lower(Product.sku).in_(list(rows)))
+    }
+    for key, (sku, name, description) in rows.items():
+        if key in existing:
+            # Update existing
+            existing[key].name = name
+            existing[key].description = description
+        else:
+            # Create new
+            db.add(Product(sku=sku, name=name, description=description, active=True))
+
+def save_import_batch(db, job_id: str, valid: list, rejects: list, own_txids: set) -> list:
+    """Apply and commit a batch together with its rejects and return all rejects.
+    
+    valid holds (line_number, record, (sku, name, description)); within the
+    batch the last row for a SKU wins. If the batch commit fails it is
+    retried row by row in savepoints so only the rows that fail are rejected.
+    The id of each transaction that writes products is added to own_txids.
+    """
+    rows = {}
+    for _, _, values in valid:
+        rows[values[0].lower()] = values
+    try:
+        apply_import_rows(db, rows)
+        add_import_rejects(db, job_id, rejects)
+        own_txids.add(get_current_txid(db))
+        db.commit()
+        return rejects
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Import batch commit failed, retrying row by row: {str(e)}")
+    
+    rejects = list(rejects)
+    for line_number, record, values in valid:
+        try:
+            with db.begin_nested():
+                apply_import_rows(db, {values[0].lower(): values})
+        except Exception as e:
+            rejects.append((line_number, record, str(e)))
+    rejects.sort(key=lambda reject: reject[0])
+    add_import_rejects(db, job_id, rejects)
+    own_txids.add(get_current_txid(db))
+    db.commit()
+    return rejects
+
 @celery_app.task(bind=True)
 def import_products(self, file_content: str, filename: str, job_id: str):
     db = get_db_session()
@@ -32,73 +121,63 @@ def import_products(self, file_content: str, filename: str, job_id: str):
         
         db.commit()
         
-        # Parse CSV
-        file_like = io.StringIO(file_content)
-        reader = csv.DictReader(file_like)
-        records = list(reader)
+        # Retention: drop rejects reports older than REJECTS_RETENTION_DAYS
+        delete_expired_import_rejects(db)
         
-        total_records = len(records)
+        # Catalog position before this job writes anything
+        start_version = get_catalog_version(db)
+        own_txids = set()
+        
+        # Count records for progress reporting without keeping them in memory
+        total_records = count_csv_records(file_content)
         import_job.total_records = total_records
         db.commit()
         
-        # Process records
+        # Process records in batches; rejected rows are stored per batch in
+        # import_rejects and only counters plus the first few messages are
+        # kept in memory
         processed = 0
-        errors = []
-        
-        for record in records:
-            try:
-                sku = record.get('sku', '').strip()
-                name = record.get('name', '').strip()
-                description = record.get('description', '').strip()
-                
-                if not sku:
-                    errors.append(f"Record {processed + 1}: Missing SKU")
-                    continue
-                
-                # Check if product exists (case-insensitive)
-                existing = db.query(Product).filter(
-                    func.lower(Product.sku) == sku.lower()
-                ).first()
-                
-                if existing:
-                    # Update existing
-                    existing.name = name
-                    existing.description = description
-                else:
-                    # Create new
-                    new_product = Product(
-                        sku=sku,
-                        name=name,
-                        description=description,
-                        active=True
-                    )
-                    db.add(new_product)
-                
-                processed += 1
-                import_job.processed_records = processed
-                
-                # Update progress
-                if processed % 100 == 0:
-                    db.commit()
-                    self.update_state(
-                        state='PROGRESS',
-                        meta={
-                            'current': processed,
-                            'total': total_records,
-                            'status': f'Processed {processed}/{total_records} records'
-                        }
-                    )
-                    
-            except Exception as e:
-                errors.append(f"Record {processed + 1}: {str(e)}")
-                continue
+        rejected = 0
+        error_sample = []
+        reader = csv.DictReader(io.StringIO(file_content))
         
-        db.commit()
+        for records in iter_import_batches(reader):
+            valid = []
+            rejects = []
+            for line_number, record in records:
+                try:
+                    valid.append((line_number, record, validate_import_row(record)))
+                except ValueError as e:
+                    rejects.append((line_number, record, str(e)))
+            
+            batch_rejects = save_import_batch(db, job_id, valid, rejects, own_txids)
+            processed += len(records) - len(batch_rejects)
+            rejected += len(batch_rejects)
+            for reject_line, _, reject_reason in batch_rejects[:10 - len(error_sample)]:
+                error_sample.append(f"Line {reject_line}: {reject_reason}")
+            
+            # Update progress
+            import_job.processed_records = processed
+            import_job.rejected_records = rejected
+            self.update_state(
+                state='PROGRESS',
+                meta={
+                    'current': processed + rejected,
+                    'total': total_records,
+                    'status': f'Processed {processed}/{total_records} records'
+                }
+            )
         
         # Finalize job
-        if errors:
+        import_job.processed_records = processed
+        import_job.rejected_records = rejected
+        # Only vouch for the catalog if nobody else wrote it while we ran
+        end_version = get_catalog_version(db)
+        if not catalog_changed_by_others(db, start_version, end_version, own_txids):
+            import_job.catalog_version = end_version
+        if rejected:
             import_job.status = "completed_with_errors"
-            import_job.errors = "\n".join(errors[:10])
+            import_job.errors = "\n".join(error_sample)
         else:
             import_job.status = "completed"
         
@@ -109,11 +188,12 @@ def import_products(self, file_content: str, filename: str, job_id: str):
             'total': total_records,
             'status': f'Import completed. Processed {processed} records.',
             'processed': processed,
-            'errors': len(errors)
+            'errors': rejected
         }
         
     except Exception as e:
         logger.error(f"Import failed: {str(e)}")
+        db.rollback()
         if 'import_job' in locals():
             import_job.status = "failed"
             import_job.errors = str(e)
@@ -133,7 +213,8 @@ def bulk_delete_products(self):
         if total == 0:
             return 0
         
-        # Delete all products (most efficient way)
+        # Delete all products (most efficient way), leaving tombstones for the change feed
+        tombstone_all_products(db)
         deleted_count = db.query(Product).delete()
         db.commit()
         
@@ -0,0 +1,106 @@
+import os
+import uuid
+
+import pytest
+
+if not os.getenv("TEST_DATABASE_URL"):
+    pytest.skip("TEST_DATABASE_URL not set", allow_module_level=True)
+pytest.importorskip("psycopg2")
+
+from app import crud
+from app.database import SessionLocal, create_tables
+from app.models import Product, ProductTombstone
+
+
+def read_changes(since):
+    """Page through the feed from `since`; returns (changes, next position)"""
+    changes = []
+    db = SessionLocal()
+    try:
+        while True:
+            page = crud.get_product_changes(db, since=since, limit=100)
+            changes += page
+            if page:
+                since = (page[-1]["txid"], page[-1]["seq"])
+            if len(page) < 100:
+                return changes, since
+    finally:
+        db.close()
+
+
+def skus(changes, prefix):
+    return [change["sku"] for change in changes if change["sku"].startswith(prefix)]
+
+
+@pytest.fixture
+def prefix():
+    create_tables()
+    prefix = f"FEED-{uuid.uuid4().hex[:8]}-"
+    yield prefix
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.sku.like(f"{prefix}%")).delete(synchronize_session=False)
+        db.query(ProductTombstone).filter(ProductTombstone.sku.like(f"{prefix}%")).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_in_flight_writer_holds_back_later_commits(prefix):
+    _, head = read_changes((0, 0))
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        # first takes the lower txid/seq but commits after second
+        first.add(Product(sku=f"{prefix}first", name="First"))
+        first.flush()
+        second.add(Product(sku=f"{prefix}second", name="Second"))
+        second.commit()
+
+        changes, position = read_changes(head)
+        assert skus(changes, prefix) == []
+
+        first.commit()
+        changes, _ = read_changes(position)
+        assert skus(changes, prefix) == [f"{prefix}first", f"{prefix}second"]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_older_transaction_with_later_seq_is_not_lost(prefix):
+    _, head = read_changes((0, 0))
+    older, newer = SessionLocal(), SessionLocal()
+    try:
+        older.add(Product(sku=f"{prefix}a", name="A"))
+        older.flush()
+        newer.add(Product(sku=f"{prefix}b", name="B"))
+        newer.flush()
+        # c gets a higher seq than b, but belongs to the older transaction
+        older.add(Product(sku=f"{prefix}c", name="C"))
+        older.flush()
+        older.commit()
+
+        seen, position = read_changes(head)
+        newer.commit()
+        more, _ = read_changes(position)
+
+        assert sorted(skus(seen + more, prefix)) == [f"{prefix}a", f"{prefix}b", f"{prefix}c"]
+    finally:
+        older.close()
+        newer.close()
+
+
+def test_deletes_appear_as_tombstones(prefix):
+    db = SessionLocal()
+    try:
+        product = Product(sku=f"{prefix}gone", name="Gone")
+        db.add(product)
+        db.commit()
+        _, head = read_changes((0, 0))
+
+        assert crud.delete_product(db, product.id)
+        changes, _ = read_changes(head)
+        deletes = [change for change in changes if change["sku"] == f"{prefix}gone"]
+        assert [change["op"] for change in deletes] == ["delete"]
+    finally:
+        db.close()
@@ -0,0 +1,108 @@
+import json
+import os
+import uuid
+
+import pytest
+
+if not os.getenv("TEST_DATABASE_URL"):
+    pytest.skip("TEST_DATABASE_URL not set", allow_module_level=True)
+pytest.importorskip("psycopg2")
+pytest.importorskip("celery")
+
+from sqlalchemy import event
+
+from app import crud, tasks
+from app.database import SessionLocal, engine
+from app.models import ImportJob, ImportReject, Product
+
+
+@pytest.fixture
+def job_id(monkeypatch):
+    monkeypatch.setattr(tasks.import_products, "update_state", lambda **kwargs: None)
+    job_id = str(uuid.uuid4())
+    yield job_id
+    db = SessionLocal()
+    try:
+        db.query(ImportReject).filter(ImportReject.job_id == job_id).delete()
+        db.query(ImportJob).filter(ImportJob.job_id == job_id).delete()
+        db.query(Product).filter(Product.sku.like(f"{job_id[:8]}-%")).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_rejected_rows_are_stored_with_line_and_reason(job_id):
+    prefix = job_id[:8]
+    rows = ["sku,name,description"]
+    rows += [f"{prefix}-{i},Product {i},ok" for i in range(150)]
+    rows.insert(10, ",No SKU,missing")                       # line 11
+    rows.insert(60, f"{prefix}-long,{'x' * 300},too long")   # line 61, name > 255
+    content = "\n".join(rows) + "\n"
+
+    result = tasks.import_products.run(content, "feed.csv", job_id)
+    assert result["processed"] == 150
+    assert result["errors"] == 2
+
+    db = SessionLocal()
+    try:
+        job = crud.get_import_job(db, job_id)
+        assert job.status == "completed_with_errors"
+        assert job.rejected_records == 2
+
+        rejects = list(crud.get_import_rejects(db, job_id))
+        assert [reject.line_number for reject in rejects] == [11, 61]
+        assert rejects[0].reason == "Missing SKU"
+        assert json.loads(rejects[1].row_data)["sku"] == f"{prefix}-long"
+
+        assert rejects[1].reason == "Name longer than 255 characters"
+
+        # A failing row inside a batch does not drop its neighbours
+        assert db.query(Product).filter(Product.sku.like(f"{prefix}-%")).count() == 150
+    finally:
+        db.close()
+
+
+def test_valid_batches_do_not_use_savepoints(job_id):
+    prefix = job_id[:8]
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    rows = ["sku,name"] + [f"{prefix}-{i},Product {i}" for i in range(250)]
+    rows.append(f"{prefix}-0,Renamed")  # duplicate SKU within the last batch
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        result = tasks.import_products.run("\n".join(rows), "feed.csv", job_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert result["processed"] == 251
+    assert not [s for s in statements if s.lstrip().upper().startswith("SAVEPOINT")]
+
+    db = SessionLocal()
+    try:
+        assert db.query(Product).filter(Product.sku.like(f"{prefix}-%")).count() == 250
+        assert crud.get_product_by_sku(db, f"{prefix}-0").name == "Renamed"
+    finally:
+        db.close()
+
+
+def test_failed_batch_is_retried_row_by_row(job_id):
+    prefix = job_id[:8]
+    rows = ["sku,name,description"] + [f"{prefix}-{i},Product {i},ok" for i in range(10)]
+    # PostgreSQL refuses NUL characters, which only shows up when the batch is written
+    rows.insert(4, f"{prefix}-nul,Broken,bad\x00value")  # line 5
+    result = tasks.import_products.run("\n".join(rows), "feed.csv", job_id)
+
+    assert result["processed"] == 10
+    assert result["errors"] == 1
+
+    db = SessionLocal()
+    try:
+        rejects = list(crud.get_import_rejects(db, job_id))
+        assert [reject.line_number for reject in rejects] == [5]
+        assert not rejects[0].reason.startswith("Batch not saved")
+        assert db.query(Product).filter(Product.sku.like(f"{prefix}-%")).count() == 10
+    finally:
+        db.close()
@@ -0,0 +1,76 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import crud
+
+
+class RecordingSession:
+    """Stands in for a Session: records the statement and returns canned rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+        rows = self.rows
+
+        class Result:
+            def mappings(self):
+                return rows
+
+        return Result()
+
+
+def test_fields_default_to_all_columns():
+    assert crud.parse_product_fields(None) == crud.PRODUCT_LIST_FIELDS
+
+
+def test_fields_are_stripped_and_deduplicated():
+    assert crud.parse_product_fields(" sku, name ,sku,,id") == ["sku", "name", "id"]
+
+
+@pytest.mark.parametrize("fields", ["", ",", " , ,"])
+def test_empty_field_selection_is_rejected(fields):
+    with pytest.raises(ValueError, match="No fields selected"):
+        crud.parse_product_fields(fields)
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(ValueError, match="Invalid fields: price, secret_key"):
+        crud.parse_product_fields("sku,price,secret_key")
+
+
+def test_rows_select_only_requested_columns():
+    db = RecordingSession([{"id": 1, "sku": "ABC123"}])
+    rows = crud.get_product_rows(db, fields=["id", "sku"], skip=10, limit=5, active=True)
+
+    assert rows == [{"id": 1, "sku": "ABC123"}]
+    stmt = db.statements[0]
+    assert [column.name for column in stmt.selected_columns] == ["id", "sku"]
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "description" not in sql
+    assert "products.active = true" in sql
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+def test_listing_endpoint_returns_only_requested_keys():
+    pytest.importorskip("psycopg2")
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    sku = f"LIST-{uuid.uuid4().hex[:12]}"
+    with TestClient(app) as client:
+        created = client.post("/api/products/", json={"sku": sku, "name": "Listing test"}).json()
+        try:
+            response = client.get(f"/api/products/?sku={sku}&fields=sku,id,sku")
+            assert response.status_code == 200
+            assert response.json() == [{"sku": sku, "id": created["id"]}]
+
+            assert client.get("/api/products/?fields=,").status_code == 400
+            assert client.get("/api/products/?fields=price").status_code == 400
+        finally:
+            client.delete(f"/api/products/{created['id']}")
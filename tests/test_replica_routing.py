@@ -0,0 +1,91 @@
+import os
+import time
+import uuid
+
+import pytest
+
+if not (os.getenv("TEST_DATABASE_URL") and os.getenv("TEST_DATABASE_REPLICA_URL")):
+    pytest.skip("TEST_DATABASE_URL and TEST_DATABASE_REPLICA_URL not set", allow_module_level=True)
+pytest.importorskip("psycopg2")
+
+from fastapi.testclient import TestClient
+
+from app import database
+from app.config import settings
+
+
+def wait_for_replica_health(expected, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        database.refresh_replica_health()
+        if database._replica_health == expected or time.monotonic() > deadline:
+            return database._replica_health
+        time.sleep(0.5)
+
+
+def test_reads_go_to_healthy_replica_only():
+    assert wait_for_replica_health([True, False]) == [True, False]
+    for _ in range(4):
+        db = database.get_read_session()
+        try:
+            assert db.get_bind() is database.replica_engines[0]
+        finally:
+            db.close()
+
+
+def test_unreachable_replica_probe_fails_fast():
+    start = time.monotonic()
+    assert database.check_replica(1, database.get_primary_wal_lsn()) is False
+    assert time.monotonic() - start < settings.REPLICA_CONNECT_TIMEOUT + 2
+
+
+def test_sticky_reads_use_primary():
+    wait_for_replica_health([True, False])
+    db = database.get_read_session(use_primary=True)
+    try:
+        assert db.get_bind() is database.engine
+    finally:
+        db.close()
+
+
+def test_write_pins_client_to_primary():
+    from app.main import app
+
+    with TestClient(app) as client:
+        sku = f"TEST-{uuid.uuid4().hex[:12]}"
+        response = client.post("/api/products/", json={"sku": sku, "name": "Replica test"})
+        assert response.status_code == 200
+        assert database.PRIMARY_STICKY_COOKIE in response.cookies
+
+        # Read-your-writes: the new product is visible immediately
+        product_id = response.json()["id"]
+        assert client.get(f"/api/products/{product_id}").status_code == 200
+
+        client.delete(f"/api/products/{product_id}")
+
+
+class FinishedTask:
+    def __init__(self, state, info):
+        self.state = state
+        self.info = info
+
+
+@pytest.mark.parametrize("path, task_name", [
+    ("/api/tasks/{}", "import_products"),
+    ("/api/tasks/bulk-delete/{}", "bulk_delete_products"),
+])
+def test_task_success_pins_client_to_primary(monkeypatch, path, task_name):
+    from app import tasks
+    from app.main import app
+
+    task = getattr(tasks, task_name)
+    states = {"done": FinishedTask("SUCCESS", {"current": 1, "total": 1}), "running": FinishedTask("PENDING", None)}
+    monkeypatch.setattr(task, "AsyncResult", lambda task_id: states[task_id])
+
+    with TestClient(app) as client:
+        running = client.get(path.format("running"))
+        assert database.PRIMARY_STICKY_COOKIE not in running.cookies
+
+        done = client.get(path.format("done"))
+        assert done.json()["state"] == "SUCCESS"
+        assert database.PRIMARY_STICKY_COOKIE in done.cookies
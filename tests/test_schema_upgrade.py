@@ -0,0 +1,85 @@
+import os
+import uuid
+
+import pytest
+
+if not os.getenv("TEST_DATABASE_URL"):
+    pytest.skip("TEST_DATABASE_URL not set", allow_module_level=True)
+pytest.importorskip("psycopg2")
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.database import create_tables
+
+# Tables as created by the first release, before change tracking and import
+# bookkeeping columns existed
+LEGACY_SCHEMA = [
+    """CREATE TABLE products (
+        id SERIAL PRIMARY KEY,
+        sku VARCHAR(100) NOT NULL UNIQUE,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        active BOOLEAN,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+        updated_at TIMESTAMP WITH TIME ZONE
+    )""",
+    "CREATE UNIQUE INDEX ix_sku_lower ON products (lower(sku))",
+    """CREATE TABLE import_jobs (
+        id SERIAL PRIMARY KEY,
+        job_id VARCHAR(100) UNIQUE,
+        filename VARCHAR(255),
+        total_records INTEGER,
+        processed_records INTEGER,
+        status VARCHAR(50),
+        errors TEXT,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+        updated_at TIMESTAMP WITH TIME ZONE
+    )""",
+    "INSERT INTO products (sku, name) VALUES ('OLD-1', 'One'), ('OLD-2', 'Two'), ('OLD-3', 'Three')",
+    "INSERT INTO import_jobs (job_id, filename, status) VALUES ('legacy-job', 'old.csv', 'completed')",
+]
+
+
+@pytest.fixture
+def legacy_engine():
+    server_url = make_url(os.environ["TEST_DATABASE_URL"])
+    name = f"upgrade_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(server_url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    engine = create_engine(server_url.set(database=name))
+    try:
+        with engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.execute(text(statement))
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE {name}"))
+        admin.dispose()
+
+
+def test_legacy_database_is_upgraded_and_backfilled(legacy_engine):
+    create_tables(bind=legacy_engine)
+    create_tables(bind=legacy_engine)  # idempotent
+
+    inspector = inspect(legacy_engine)
+    products = {c["name"]: c for c in inspector.get_columns("products")}
+    assert not products["change_seq"]["nullable"]
+    assert not products["change_txid"]["nullable"]
+    assert {"ix_products_change", "ix_products_change_seq"} <= {
+        i["name"] for i in inspector.get_indexes("products")
+    }
+    assert {"rejected_records", "content_hash", "catalog_version"} <= {
+        c["name"] for c in inspector.get_columns("import_jobs")
+    }
+
+    with Session(legacy_engine) as db:
+        # Rows that existed before the upgrade show up in the first sync
+        changes = crud.get_product_changes(db, since=(0, 0))
+        assert sorted(change["sku"] for change in changes) == ["OLD-1", "OLD-2", "OLD-3"]
+        assert crud.get_import_job(db, "legacy-job").rejected_records == 0
@@ -0,0 +1,121 @@
+import os
+import uuid
+
+import pytest
+
+if not os.getenv("TEST_DATABASE_URL"):
+    pytest.skip("TEST_DATABASE_URL not set", allow_module_level=True)
+pytest.importorskip("psycopg2")
+pytest.importorskip("celery")
+
+from fastapi.testclient import TestClient
+
+from app import crud, tasks
+from app.database import SessionLocal
+from app.models import ImportJob, ImportReject, Product
+
+
+class InlineResult:
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from app.main import app
+
+    # Run imports inline instead of through the Celery broker
+    def delay(*args):
+        tasks.import_products.run(*args)
+        return InlineResult()
+
+    monkeypatch.setattr(tasks.import_products, "update_state", lambda **kwargs: None)
+    monkeypatch.setattr(tasks.import_products, "delay", delay)
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def prefix():
+    prefix = f"DUP-{uuid.uuid4().hex[:8]}-"
+    yield prefix
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.sku.like(f"{prefix}%")).delete(synchronize_session=False)
+        jobs = db.query(ImportJob.job_id).filter(ImportJob.filename.like(f"{prefix}%"))
+        db.query(ImportReject).filter(ImportReject.job_id.in_(jobs)).delete(synchronize_session=False)
+        db.query(ImportJob).filter(ImportJob.filename.like(f"{prefix}%")).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def upload(client, prefix, content, **params):
+    files = {"file": (f"{prefix}feed.csv", content, "text/csv")}
+    response = client.post("/api/upload/", files=files, params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def feed(prefix):
+    return "sku,name\n" + "".join(f"{prefix}{i},Product {i}\n" for i in range(5))
+
+
+def test_identical_upload_reuses_previous_job(client, prefix):
+    first = upload(client, prefix, feed(prefix))
+    assert "duplicate_of" not in first
+
+    second = upload(client, prefix, feed(prefix))
+    assert second["duplicate_of"] == first["job_id"]
+    assert second["task_id"] is None
+
+
+def test_force_reimports_identical_upload(client, prefix):
+    first = upload(client, prefix, feed(prefix))
+    forced = upload(client, prefix, feed(prefix), force="true")
+    assert "duplicate_of" not in forced
+    assert forced["job_id"] != first["job_id"]
+
+
+def test_catalog_change_after_import_forces_reimport(client, prefix):
+    upload(client, prefix, feed(prefix))
+    db = SessionLocal()
+    try:
+        product = crud.get_product_by_sku(db, f"{prefix}0")
+        assert crud.delete_product(db, product.id)
+    finally:
+        db.close()
+
+    again = upload(client, prefix, feed(prefix))
+    assert "duplicate_of" not in again
+    db = SessionLocal()
+    try:
+        assert crud.get_product_by_sku(db, f"{prefix}0") is not None
+    finally:
+        db.close()
+
+
+def test_foreign_write_during_import_is_not_vouched_for(client, prefix, monkeypatch):
+    save_import_batch = tasks.save_import_batch
+
+    def save_with_concurrent_edit(*args):
+        rejects = save_import_batch(*args)
+        # Another writer touches the catalog while the import runs
+        db = SessionLocal()
+        try:
+            db.add(Product(sku=f"{prefix}other", name="Edited elsewhere"))
+            db.commit()
+        finally:
+            db.close()
+        return rejects
+
+    monkeypatch.setattr(tasks, "save_import_batch", save_with_concurrent_edit)
+    first = upload(client, prefix, feed(prefix))
+    monkeypatch.setattr(tasks, "save_import_batch", save_import_batch)
+
+    db = SessionLocal()
+    try:
+        assert crud.get_import_job(db, first["job_id"]).catalog_version is None
+    finally:
+        db.close()
+    assert "duplicate_of" not in upload(client, prefix, feed(prefix))